@@ -1,45 +1,115 @@
 # backend/embedder.py
 from __future__ import annotations
+from functools import lru_cache
 from typing import Iterable, List, Optional
+import os
+import platform
+import threading
 import numpy as np
 import torch
+
+# Let the Rust tokenizer parallelize the single whole-corpus tokenize call in encode().
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "true")
 from transformers import AutoModel, AutoTokenizer
 
+# CPU inference: leave half the cores for the API server / tokenizer threads.
+if not torch.cuda.is_available():
+    torch.set_num_threads(max(1, (os.cpu_count() or 2) // 2))
+
+_embedder_lock = threading.Lock()
+
 def _mean_pool(last_hidden_state: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
-    mask = attention_mask.unsqueeze(-1).expand(last_hidden_state.size()).float()
-    masked = last_hidden_state * mask
-    summed = torch.sum(masked, dim=1)
-    counts = torch.clamp(mask.sum(dim=1), min=1e-9)
+    # Single reduction over the hidden state; no (B, L, H) mask is materialized.
+    mask = attention_mask.to(last_hidden_state.dtype)
+    summed = torch.einsum("blh,bl->bh", last_hidden_state, mask)
+    counts = mask.sum(dim=1, keepdim=True).clamp_min(1)
     return summed / counts
 
 class TextEmbedder:
     """
     Transformer-based embedder using mean-pooling. No sentence-transformers dependency.
     """
-    def __init__(self, model_name: str = "microsoft/BiomedNLP-PubMedBERT-base-uncased-abstract", device: Optional[str] = None, max_length: int = 512):
+    def __init__(self, model_name: str = "microsoft/BiomedNLP-PubMedBERT-base-uncased-abstract", device: Optional[str] = None, max_length: int = 512, compile_model: bool = False, dtype: torch.dtype = torch.float16, int8: bool = False):
         self.model_name = model_name
         self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
         self.max_length = max_length
-        self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        self._use_cuda = self.device.startswith("cuda")
+        # Reduced precision only pays off on GPU tensor cores; CPU stays FP32.
+        self.dtype = dtype if self._use_cuda else torch.float32
+        self._tokenizer = AutoTokenizer.from_pretrained(self.model_name, use_fast=True)
         self._model = AutoModel.from_pretrained(self.model_name)
         self._model.eval()
         self._model.to(self.device)
+        if self._use_cuda and self.dtype == torch.float16:
+            self._model.half()
+        if int8 and not self._use_cuda:
+            # Dynamic INT8 Linear layers help on CPU only; on GPU FP16 is usually faster.
+            machine = platform.machine().lower()
+            torch.backends.quantized.engine = "qnnpack" if machine.startswith(("arm", "aarch64")) else "fbgemm"
+            self._model = torch.ao.quantization.quantize_dynamic(self._model, {torch.nn.Linear}, dtype=torch.qint8)
+        if compile_model:
+            # Compile and warm up under inference_mode so the traced graph matches encode().
+            # Dynamo specializes batch size 1, so warm both the query shape and the batch-8 document shape.
+            with torch.inference_mode():
+                self._model = torch.compile(self._model, mode="reduce-overhead", dynamic=True)
+                self.encode(["warmup"], batch_size=1)
+                self.encode(["warmup"] * 8, batch_size=8)
+
+    @property
+    def hidden_size(self) -> int:
+        return self._model.config.hidden_size
 
-    @torch.inference_mode()
     def encode(self, texts: Iterable[str], batch_size: int = 16, normalize: bool = True) -> np.ndarray:
+        return self.encode_tensor(texts, batch_size=batch_size, normalize=normalize).float().cpu().numpy()
+
+    @torch.inference_mode()
+    def encode_tensor(self, texts: Iterable[str], batch_size: int = 16, normalize: bool = True, out: Optional[torch.Tensor] = None) -> torch.Tensor:
+        """
+        Like encode, but keeps results on self.device as a (N, H) tensor of self.dtype.
+        If out is given, embeddings are written into it in place.
+        """
         texts_list: List[str] = [t if isinstance(t, str) else str(t) for t in texts]
+        if out is None:
+            out = torch.empty((len(texts_list), self.hidden_size), device=self.device, dtype=self.dtype)
         if len(texts_list) == 0:
-            return np.zeros((0, self._model.config.hidden_size), dtype=np.float32)
+            return out
 
-        all_embeddings = []
-        for start in range(0, len(texts_list), batch_size):
-            batch = texts_list[start : start + batch_size]
-            inputs = self._tokenizer(batch, padding=True, truncation=True, max_length=self.max_length, return_tensors="pt")
+        # Tokenize once without padding, then batch texts of similar length together so
+        # each batch is only padded to its own max length instead of the global one.
+        enc = self._tokenizer(texts_list, padding=False, truncation=True, max_length=self.max_length)
+        order = np.argsort([len(ids) for ids in enc["input_ids"]], kind="stable")
+        for start in range(0, len(order), batch_size):
+            idx = order[start : start + batch_size]
+            features = [{k: enc[k][i] for k in enc.keys()} for i in idx]
+            inputs = self._tokenizer.pad(features, return_tensors="pt")
             inputs = {k: v.to(self.device) for k, v in inputs.items()}
-            outputs = self._model(**inputs)
-            token_embeddings = outputs.last_hidden_state
-            sentence_embeddings = _mean_pool(token_embeddings, inputs["attention_mask"])
+            with torch.autocast("cuda", dtype=self.dtype, enabled=self._use_cuda):
+                outputs = self._model(**inputs)
+                token_embeddings = outputs.last_hidden_state
+                sentence_embeddings = _mean_pool(token_embeddings, inputs["attention_mask"])
+            # Normalize in FP32 for numerical stability.
+            sentence_embeddings = sentence_embeddings.float()
             if normalize:
                 sentence_embeddings = torch.nn.functional.normalize(sentence_embeddings, p=2, dim=1)
-            all_embeddings.append(sentence_embeddings.detach().cpu().numpy().astype(np.float32, copy=False))
-        return np.vstack(all_embeddings)
+            out[torch.as_tensor(idx, device=out.device)] = sentence_embeddings.to(out.dtype)
+        return out
+
+@lru_cache(maxsize=4)
+def _cached_embedder(model_name: str, device: Optional[str], max_length: int, compile_model: bool, int8: bool) -> TextEmbedder:
+    return TextEmbedder(model_name=model_name, device=device, max_length=max_length, compile_model=compile_model, int8=int8)
+
+def _env_flag(name: str) -> bool:
+    return os.getenv(name, "0").lower() in ("1", "true", "yes")
+
+def get_embedder(model_name: str = "microsoft/BiomedNLP-PubMedBERT-base-uncased-abstract", device: Optional[str] = None, max_length: int = 512, compile_model: Optional[bool] = None, int8: Optional[bool] = None) -> TextEmbedder:
+    """
+    Return a shared TextEmbedder for (model_name, device, max_length) so weights load once per process.
+    Set EMBEDDER_COMPILE=1 to torch.compile the encoder and EMBEDDER_INT8=1 to quantize it on CPU.
+    """
+    device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+    if compile_model is None:
+        compile_model = _env_flag("EMBEDDER_COMPILE")
+    if int8 is None:
+        int8 = _env_flag("EMBEDDER_INT8")
+    with _embedder_lock:
+        return _cached_embedder(model_name, device, max_length, compile_model, int8)
@@ -0,0 +1,145 @@
+# backend/embedding_cache.py
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Tuple
+import numpy as np
+
+_DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".cache", "pubmed_emb.sqlite")
+
+class EmbeddingCache:
+    """
+    Persistent (model_name, pmid) -> embedding store, evicted least-recently-used.
+    Vectors live in one memory-mapped float16 matrix file per model; sqlite maps PMIDs to matrix rows
+    and tracks recency. Rows freed by eviction are reused by later inserts.
+    """
+    def __init__(self, path: str = _DEFAULT_PATH, max_rows: int = 200_000):
+        self.path = path
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._matrices: Dict[str, np.memmap] = {}
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            # earlier layout kept one float32 blob per row in sqlite
+            conn.execute("DROP TABLE IF EXISTS embeddings")
+            conn.execute("CREATE TABLE IF NOT EXISTS models (model TEXT PRIMARY KEY, dim INTEGER NOT NULL, capacity INTEGER NOT NULL)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embedding_rows ("
+                "model TEXT NOT NULL, pmid TEXT NOT NULL, row INTEGER NOT NULL, last_used REAL NOT NULL, "
+                "PRIMARY KEY (model, pmid))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_embedding_rows_last_used ON embedding_rows (last_used)")
+            conn.execute("CREATE TABLE IF NOT EXISTS free_rows (model TEXT NOT NULL, row INTEGER NOT NULL)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _matrix_path(self, model_name: str) -> str:
+        digest = hashlib.sha1(model_name.encode("utf-8")).hexdigest()[:16]
+        return f"{os.path.splitext(self.path)[0]}.{digest}.f16"
+
+    def _matrix(self, model_name: str, dim: int, capacity: int) -> np.memmap:
+        matrix = self._matrices.get(model_name)
+        if matrix is None or matrix.shape[0] < capacity:
+            path = self._matrix_path(model_name)
+            size = capacity * dim * np.dtype(np.float16).itemsize
+            with open(path, "ab"):
+                pass
+            if os.path.getsize(path) < size:
+                os.truncate(path, size)
+            matrix = np.memmap(path, dtype=np.float16, mode="r+", shape=(capacity, dim))
+            self._matrices[model_name] = matrix
+        return matrix
+
+    @staticmethod
+    def _select_rows(conn: sqlite3.Connection, model_name: str, pmids: List[str]) -> List[Tuple[str, int]]:
+        rows = []
+        # stay well below sqlite's bound-parameter limit
+        for start in range(0, len(pmids), 500):
+            chunk = pmids[start : start + 500]
+            marks = ",".join("?" * len(chunk))
+            rows.extend(conn.execute(
+                f"SELECT pmid, row FROM embedding_rows WHERE model = ? AND pmid IN ({marks})", [model_name, *chunk]
+            ).fetchall())
+        return rows
+
+    def get_many(self, model_name: str, pmids: List[str]) -> Tuple[List[str], np.ndarray]:
+        """
+        Return (found_pmids, vectors) where vectors[i] is the float16 embedding of found_pmids[i].
+        """
+        empty = ([], np.zeros((0, 0), dtype=np.float16))
+        if not pmids:
+            return empty
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            meta = conn.execute("SELECT dim, capacity FROM models WHERE model = ?", (model_name,)).fetchone()
+            if meta is None:
+                return empty
+            dim, capacity = meta
+            rows = self._select_rows(conn, model_name, pmids)
+            if not rows:
+                return [], np.zeros((0, dim), dtype=np.float16)
+            conn.executemany(
+                "UPDATE embedding_rows SET last_used = ? WHERE model = ? AND pmid = ?",
+                [(now, model_name, pmid) for pmid, _ in rows],
+            )
+            # gather only the requested rows out of the mapped file
+            vectors = self._matrix(model_name, dim, capacity)[[row for _, row in rows]]
+        return [pmid for pmid, _ in rows], vectors
+
+    def put_many(self, model_name: str, pmids: List[str], embeddings: np.ndarray) -> None:
+        if not pmids:
+            return
+        items = dict(zip(pmids, np.asarray(embeddings, dtype=np.float16)))
+        dim = embeddings.shape[1]
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            # self._lock only covers this process; take sqlite's write lock before reading capacity and
+            # free rows so workers sharing the file cannot hand out the same row
+            conn.execute("BEGIN IMMEDIATE")
+            meta = conn.execute("SELECT dim, capacity FROM models WHERE model = ?", (model_name,)).fetchone()
+            capacity = meta[1] if meta else 0
+
+            # overwrite rows already held for these PMIDs, then fill freed rows, then grow the matrix
+            assigned = dict(self._select_rows(conn, model_name, list(items)))
+            new = [pmid for pmid in items if pmid not in assigned]
+            free = [row for (row,) in conn.execute("SELECT row FROM free_rows WHERE model = ? LIMIT ?", (model_name, len(new)))]
+            conn.executemany("DELETE FROM free_rows WHERE model = ? AND row = ?", [(model_name, row) for row in free])
+            grow = len(new) - len(free)
+            assigned.update(zip(new, free + list(range(capacity, capacity + grow))))
+            capacity += grow
+            conn.execute("INSERT OR REPLACE INTO models (model, dim, capacity) VALUES (?, ?, ?)", (model_name, dim, capacity))
+
+            matrix = self._matrix(model_name, dim, capacity)
+            matrix[[assigned[pmid] for pmid in items]] = np.stack(list(items.values()))
+            matrix.flush()
+            conn.executemany(
+                "INSERT OR REPLACE INTO embedding_rows (model, pmid, row, last_used) VALUES (?, ?, ?, ?)",
+                [(model_name, pmid, assigned[pmid], now) for pmid in items],
+            )
+
+            (count,) = conn.execute("SELECT COUNT(*) FROM embedding_rows").fetchone()
+            if count > self.max_rows:
+                stale = conn.execute(
+                    "SELECT model, pmid, row FROM embedding_rows ORDER BY last_used LIMIT ?", (count - self.max_rows,)
+                ).fetchall()
+                conn.executemany("DELETE FROM embedding_rows WHERE model = ? AND pmid = ?", [(m, p) for m, p, _ in stale])
+                conn.executemany("INSERT INTO free_rows (model, row) VALUES (?, ?)", [(m, r) for m, _, r in stale])
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_embedding_cache() -> EmbeddingCache:
+    """
+    Process-wide cache; location and size come from EMBEDDING_CACHE_PATH / EMBEDDING_CACHE_MAX_ROWS.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache(
+                path=os.getenv("EMBEDDING_CACHE_PATH", _DEFAULT_PATH),
+                max_rows=int(os.getenv("EMBEDDING_CACHE_MAX_ROWS", "200000")),
+            )
+        return _cache
@@ -1,92 +1,140 @@
-# backend/gemini_integration.py
 """
 Adapter for Gemini (Google Generative) summarization with local fallback.
 Set GEMINI_API_KEY and GEMINI_ENDPOINT if you have access to Google Generative API.
 If not, the function falls back to a local HF summarizer (smaller model).
 """
 
+import asyncio
 import os
-import requests
-from typing import Optional
+import threading
+import httpx
+from typing import List, Optional, Tuple
 
 _local_summarizer = None
+_local_summarizer_lock = threading.Lock()
+_client: Optional[httpx.AsyncClient] = None
+_client_loop = None
+# status retries for Gemini calls: up to 2 retries, backoff 0.2 s, 0.4 s
+_RETRY_TOTAL = 2
+_RETRY_BACKOFF = 0.2
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
 
 def _init_local_summarizer():
     global _local_summarizer
-    if _local_summarizer is None:
-        try:
-            from transformers import pipeline
-            import torch
-            device = 0 if torch.cuda.is_available() else -1
-            _local_summarizer = pipeline("summarization", model="sshleifer/distilbart-cnn-12-6", device=device)
-        except Exception as e:
-            print("Local summarizer initialization failed:", e)
-            _local_summarizer = None
+    with _local_summarizer_lock:
+        if _local_summarizer is None:
+            try:
+                from transformers import pipeline
+                import torch
+                if torch.cuda.is_available():
+                    _local_summarizer = pipeline("summarization", model="sshleifer/distilbart-cnn-6-6", device=0, torch_dtype=torch.float16)
+                else:
+                    _local_summarizer = pipeline("summarization", model="sshleifer/distilbart-cnn-6-6", device=-1)
+            except Exception as e:
+                print("Local summarizer initialization failed:", e)
+                _local_summarizer = None
 
-def call_gemini_summarize(api_key: Optional[str], title: str, abstract: str, model: Optional[str] = None) -> str:
+def _get_client() -> httpx.AsyncClient:
     """
-    Summarize using Gemini if api_key provided; otherwise use local fallback.
-    Returns a concise summary string.
+    Shared keep-alive client so TLS handshakes are paid once, not per summary call.
+    """
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        # limits must go on the transport; httpx ignores client-level limits when a transport is given
+        _client = httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(
+                retries=2,
+                limits=httpx.Limits(max_connections=16, max_keepalive_connections=8),
+            ),
+        )
+        _client_loop = loop
+    return _client
+
+async def close_client() -> None:
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+
+async def _post_with_retry(client: httpx.AsyncClient, url: str, **kwargs) -> httpx.Response:
+    """
+    POST, retrying 429/5xx responses with exponential backoff. Connection retries happen in the transport.
+    """
+    for attempt in range(_RETRY_TOTAL + 1):
+        resp = await client.post(url, **kwargs)
+        if resp.status_code not in _RETRY_STATUSES or attempt == _RETRY_TOTAL:
+            return resp
+        await asyncio.sleep(_RETRY_BACKOFF * 2 ** attempt)
+
+def _article_text(title: str, abstract: str) -> str:
+    return (title or "") + "\n\n" + (abstract or "")
+
+def _response_text(j) -> str:
+    """
+    Read candidates[0].content.parts[0].text, or candidates[0].content when it is a plain string.
+    """
+    try:
+        content = j["candidates"][0]["content"]
+        if isinstance(content, str):
+            return content.strip()
+        return content["parts"][0]["text"].strip()
+    except (KeyError, IndexError, TypeError, AttributeError):
+        return ""
+
+async def _gemini_summarize(client: httpx.AsyncClient, api_key: str, endpoint: str, model: str, title: str, abstract: str) -> Optional[str]:
+    """
+    One Gemini generate call; returns None if the call fails or the response has no text.
     """
-    model = model or os.getenv("GEMINI_MODEL", "gemini-1.5")
-    endpoint = os.getenv("GEMINI_ENDPOINT")
-    text = (title or "") + "\n\n" + (abstract or "")
     prompt = (
         "Summarize the following PubMed article for a researcher in 3 short bullet points (<=25 words each), "
         "then give a 1-line key takeaway. Keep language concise and technical when appropriate.\n\n"
-        f"Article:\n{text}"
+        f"Article:\n{_article_text(title, abstract)}"
     )
+    try:
+        url = f"{endpoint}/{model}:generate"
+        headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+        payload = {
+            "prompt": {"text": prompt},
+            "temperature": 0.0,
+            "maxOutputTokens": 350
+        }
+        resp = await _post_with_retry(client, url, headers=headers, json=payload, timeout=30)
+        resp.raise_for_status()
+        text = _response_text(resp.json())
+        if text:
+            return text
+        print("Gemini response unexpected; falling back to local summarizer.")
+    except Exception as e:
+        print("Gemini call failed:", type(e).__name__, e)
+    return None
 
-    if api_key and endpoint:
-        try:
-            url = f"{endpoint}/{model}:generate"
-            headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
-            payload = {
-                "prompt": {"text": prompt},
-                "temperature": 0.0,
-                "maxOutputTokens": 350
-            }
-            resp = requests.post(url, headers=headers, json=payload, timeout=30)
-            resp.raise_for_status()
-            j = resp.json()
-            # Try to extract text
-            if isinstance(j, dict):
-                if "candidates" in j and isinstance(j["candidates"], list) and j["candidates"]:
-                    return j["candidates"][0].get("content", "").strip()
-                # try search for first string
-                def find_text(obj):
-                    if isinstance(obj, str):
-                        return obj
-                    if isinstance(obj, dict):
-                        for v in obj.values():
-                            r = find_text(v)
-                            if r:
-                                return r
-                    if isinstance(obj, list):
-                        for it in obj:
-                            r = find_text(it)
-                            if r:
-                                return r
-                    return None
-                candidate = find_text(j)
-                if candidate:
-                    return candidate.strip()
-            print("Gemini response unexpected; falling back to local summarizer.")
-        except Exception as e:
-            print("Gemini call failed:", type(e).__name__, e)
-
-    # Local fallback
+def summarize_batch(texts: List[str]) -> List[Optional[str]]:
+    """
+    Summarize texts with the local HF summarizer in one batched pipeline call.
+    Entries are None if the summarizer is unavailable.
+    """
+    if not texts:
+        return []
     try:
         _init_local_summarizer()
         if _local_summarizer:
-            input_text = text if len(text) <= 3000 else text[:3000]
-            out = _local_summarizer(input_text, max_length=110, min_length=30, do_sample=False)
-            if isinstance(out, list) and out and isinstance(out[0], dict):
-                return out[0].get("summary_text", "").strip()
-            return str(out)[:800]
+            inputs = [t if len(t) <= 3000 else t[:3000] for t in texts]
+            out = _local_summarizer(inputs, max_length=110, min_length=30, do_sample=False, batch_size=8, truncation=True)
+            summaries = []
+            for o in out:
+                if isinstance(o, list) and o:
+                    o = o[0]
+                if isinstance(o, dict):
+                    summaries.append(o.get("summary_text", "").strip())
+                else:
+                    summaries.append(str(o)[:800])
+            return summaries
     except Exception as e:
         print("Local summarizer failed:", e)
+    return [None] * len(texts)
 
+def _naive_summary(abstract: str) -> str:
     # Last fallback: naive truncation and bullets
     short = (abstract or "")[:450]
     sents = [s.strip() for s in short.split(". ") if s.strip()]
@@ -95,3 +143,34 @@ def call_gemini_summarize(api_key: Optional[str], title: str, abstract: str, mod
         bullets.append(f"- {s.strip()}.")
     takeaway = sents[0][:120] + "..." if sents else ""
     return "\n".join(bullets) + ("\n\nKey takeaway: " + takeaway if takeaway else "")
+
+async def summarize_articles(api_key: Optional[str], articles: List[Tuple[str, str]], model: Optional[str] = None) -> List[str]:
+    """
+    Summarize (title, abstract) pairs. Gemini requests run concurrently when api_key is provided;
+    anything left unsummarized goes through one batched local summarizer call.
+    """
+    model = model or os.getenv("GEMINI_MODEL", "gemini-1.5")
+    endpoint = os.getenv("GEMINI_ENDPOINT")
+    summaries: List[Optional[str]] = [None] * len(articles)
+
+    if api_key and endpoint and articles:
+        client = _get_client()
+        summaries = list(await asyncio.gather(
+            *[_gemini_summarize(client, api_key, endpoint, model, title, abstract) for title, abstract in articles]
+        ))
+
+    missing = [i for i, s in enumerate(summaries) if not s]
+    if missing:
+        texts = [_article_text(*articles[i]) for i in missing]
+        local = await asyncio.to_thread(summarize_batch, texts)
+        for i, s in zip(missing, local):
+            summaries[i] = s or _naive_summary(articles[i][1])
+    return summaries
+
+async def call_gemini_summarize(api_key: Optional[str], title: str, abstract: str, model: Optional[str] = None) -> str:
+    """
+    Summarize using Gemini if api_key provided; otherwise use local fallback.
+    Returns a concise summary string.
+    """
+    summaries = await summarize_articles(api_key, [(title, abstract)], model=model)
+    return summaries[0]
@@ -1,15 +1,24 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
+import json
 import os
 from dotenv import load_dotenv
-from search_logic import run_search_pipeline
+from search_logic import run_search_pipeline, iter_search_events
+from pubmed_fetcher import close_session
+from gemini_integration import close_client
 
 # 🔹 Always load backend/.env explicitly
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), ".env"))
 
 app = FastAPI(title="PubMed Semantic Search API")
 
+@app.on_event("shutdown")
+async def close_http_clients():
+    await close_session()
+    await close_client()
+
 # --- Debug endpoints (you can remove later if not needed) ---
 @app.get("/ping")
 def ping():
@@ -33,26 +42,47 @@ class SearchRequest(BaseModel):
     use_gemini_summary: Optional[bool] = False
     gemini_api_key: Optional[str] = None
 
-@app.post("/search")
-def search(req: SearchRequest):
+def _pipeline_args(req: SearchRequest) -> dict:
     ncbi_email = os.getenv("NCBI_EMAIL")
     if not ncbi_email:
         raise HTTPException(status_code=400, detail="NCBI_EMAIL environment variable not set.")
 
     ncbi_api_key = os.getenv("NCBI_API_KEY")
 
+    return dict(
+        query=req.query,
+        retmax=req.retmax,
+        top_k=req.top_k,
+        model_name=req.model_name,
+        ncbi_email=ncbi_email,
+        ncbi_api_key=ncbi_api_key,
+        use_mesh=req.use_mesh,
+        use_gemini_summary=req.use_gemini_summary,
+        gemini_api_key=req.gemini_api_key
+    )
+
+@app.post("/search")
+async def search(req: SearchRequest):
+    args = _pipeline_args(req)
     try:
-        out = run_search_pipeline(
-            query=req.query,
-            retmax=req.retmax,
-            top_k=req.top_k,
-            model_name=req.model_name,
-            ncbi_email=ncbi_email,
-            ncbi_api_key=ncbi_api_key,
-            use_mesh=req.use_mesh,
-            use_gemini_summary=req.use_gemini_summary,
-            gemini_api_key=req.gemini_api_key
-        )
+        out = await run_search_pipeline(**args)
         return out
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/search/stream")
+async def search_stream(req: SearchRequest):
+    """
+    Same search as /search, streamed as newline-delimited JSON events (meta, result..., summary...).
+    Errors after the stream has started arrive as a {"type": "error"} line.
+    """
+    args = _pipeline_args(req)
+
+    async def gen():
+        try:
+            async for event in iter_search_events(**args):
+                yield json.dumps(event) + "\n"
+        except Exception as e:
+            yield json.dumps({"type": "error", "detail": str(e)}) + "\n"
+
+    return StreamingResponse(gen(), media_type="application/x-ndjson")
@@ -1,8 +1,90 @@
 # backend/pubmed_fetcher.py
+import asyncio
+import io
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import List, Optional
-from Bio import Entrez
-import re
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+import aiohttp
+from lxml import etree
+
+EUTILS_BASE = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils"
+EFETCH_CHUNK_SIZE = 200
+# NCBI allows 10 requests/s with an API key, 3 without.
+MIN_REQUEST_INTERVAL = {True: 0.1, False: 0.34}
+MAX_RETRIES = 3
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# lxml releases the GIL while parsing, so efetch chunks parse in parallel on this pool.
+# Within a chunk iterparse streams sequentially so each element can be cleared once parsed.
+_PARSE_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="pubmed-parse")
+
+# One keep-alive connection pool to E-utilities, shared across requests on the running event loop.
+_session: Optional[aiohttp.ClientSession] = None
+_session_loop = None
+
+def _get_session() -> aiohttp.ClientSession:
+    global _session, _session_loop
+    loop = asyncio.get_running_loop()
+    if _session is None or _session.closed or _session_loop is not loop:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=16, keepalive_timeout=60),
+            timeout=aiohttp.ClientTimeout(total=120),
+        )
+        _session_loop = loop
+    return _session
+
+async def close_session() -> None:
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+class _RateLimiter:
+    """
+    Spaces request start times at least `interval` seconds apart.
+    Slots are reserved without awaiting, so concurrent callers on one event loop never share a slot.
+    """
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._next = 0.0
+
+    async def wait(self) -> None:
+        now = time.monotonic()
+        start = max(now, self._next)
+        self._next = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+# one limiter per API key (or keyless), shared by every search in the process
+_limiters: Dict[str, _RateLimiter] = {}
+
+def _get_limiter(api_key: Optional[str]) -> _RateLimiter:
+    key = api_key or ""
+    if key not in _limiters:
+        _limiters[key] = _RateLimiter(MIN_REQUEST_INTERVAL[bool(api_key)])
+    return _limiters[key]
+
+async def _eutils_request(session: aiohttp.ClientSession, limiter: _RateLimiter, method: str, url: str, **kwargs) -> bytes:
+    """
+    Rate-limited E-utilities call; retries 429/5xx and connection errors with exponential backoff.
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        await limiter.wait()
+        try:
+            async with session.request(method, url, **kwargs) as resp:
+                if resp.status in _RETRY_STATUSES and attempt < MAX_RETRIES:
+                    retry_after = resp.headers.get("Retry-After", "")
+                    delay = float(retry_after) if retry_after.isdigit() else 0.5 * 2 ** attempt
+                    await asyncio.sleep(delay)
+                    continue
+                resp.raise_for_status()
+                return await resp.read()
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            if attempt >= MAX_RETRIES:
+                raise
+            await asyncio.sleep(0.5 * 2 ** attempt)
 
 @dataclass
 class PubMedArticle:
@@ -14,43 +96,35 @@ class PubMedArticle:
     year: Optional[str] = None
     authors: Optional[List[str]] = None
 
-def _parse_article(entry: dict) -> Optional[PubMedArticle]:
+def _text(elem) -> str:
+    # itertext() drops inline markup such as <i>/<sup> while keeping its text
+    return "".join(elem.itertext()) if elem is not None else ""
+
+def _parse_article(elem) -> Optional[PubMedArticle]:
     try:
-        medline = entry.get("MedlineCitation", {})
-        pmid_raw = medline.get("PMID")
-        pmid = pmid_raw.get("#text") if isinstance(pmid_raw, dict) else str(pmid_raw)
+        medline = elem.find("MedlineCitation")
+        if medline is None:
+            return None
+        pmid = (medline.findtext("PMID") or "").strip()
         if not pmid:
             return None
 
-        article = medline.get("Article", {})
-        title = article.get("ArticleTitle") or ""
-        abstract_parts = article.get("Abstract", {}).get("AbstractText")
-        abstract = ""
-
-        if isinstance(abstract_parts, list):
-            texts = []
-            for x in abstract_parts:
-                if hasattr(x, "content"):
-                    texts.append(str(x.content))
-                else:
-                    texts.append(str(x))
-            abstract = " ".join(texts)
-        elif isinstance(abstract_parts, str):
-            abstract = abstract_parts
-        elif abstract_parts:
-            abstract = str(abstract_parts)
-
-        abstract = re.sub(r"<[^>]+>", "", abstract)
-        abstract = re.sub(r"\s+", " ", abstract).strip()
-
-        journal_info = article.get("Journal", {}).get("Title")
-        pub_date = article.get("Journal", {}).get("JournalIssue", {}).get("PubDate", {})
-        year = pub_date.get("Year") or pub_date.get("MedlineDate")
-        authors_list = article.get("AuthorList") or []
+        article = medline.find("Article")
+        if article is None:
+            return None
+        title = _text(article.find("ArticleTitle")).strip()
+        abstract = " ".join(_text(x) for x in article.iterfind("Abstract/AbstractText"))
+        abstract = " ".join(abstract.split())
+
+        journal_info = article.findtext("Journal/Title")
+        pub_date = article.find("Journal/JournalIssue/PubDate")
+        year = None
+        if pub_date is not None:
+            year = pub_date.findtext("Year") or pub_date.findtext("MedlineDate")
         authors = []
-        for a in authors_list:
-            last = a.get("LastName")
-            fore = a.get("ForeName") or a.get("Initials")
+        for a in article.iterfind("AuthorList/Author"):
+            last = a.findtext("LastName")
+            fore = a.findtext("ForeName") or a.findtext("Initials")
             if last and fore:
                 authors.append(f"{fore} {last}")
             elif last:
@@ -58,11 +132,11 @@ def _parse_article(entry: dict) -> Optional[PubMedArticle]:
 
         url = f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/"
         return PubMedArticle(
-            pmid=str(pmid),
-            title=title if isinstance(title, str) else str(title),
+            pmid=pmid,
+            title=title,
             abstract=abstract,
             url=url,
-            journal=journal_info if isinstance(journal_info, str) else None,
+            journal=journal_info or None,
             year=str(year) if year else None,
             authors=authors if authors else None,
         )
@@ -70,28 +144,71 @@ def _parse_article(entry: dict) -> Optional[PubMedArticle]:
         print("Parsing error:", e)
         return None
 
-def fetch_pubmed_articles(query: str, retmax: int = 50, email: Optional[str] = None, api_key: Optional[str] = None) -> List[PubMedArticle]:
+def _iter_articles(source) -> Iterator[PubMedArticle]:
     """
-    Search and fetch PubMed articles; returns PubMedArticle objects.
+    Stream-parse an efetch XML payload one PubmedArticle at a time, freeing each element afterwards.
     """
-    Entrez.email = (email or "").strip() or "pubmed-semantic@example.com"
+    for _, elem in etree.iterparse(source, tag="PubmedArticle"):
+        parsed = _parse_article(elem)
+        elem.clear()
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+        if parsed:
+            yield parsed
+
+def _parse_efetch_xml(data: bytes) -> List[PubMedArticle]:
+    return list(_iter_articles(io.BytesIO(data)))
+
+async def _efetch_chunk(session: aiohttp.ClientSession, limiter: _RateLimiter, sem: asyncio.Semaphore, ids: List[str], params: Dict[str, str], failed_chunks: Optional[List[List[str]]]) -> List[PubMedArticle]:
+    async with sem:
+        data = {**params, "db": "pubmed", "id": ",".join(ids), "rettype": "abstract", "retmode": "xml"}
+        try:
+            body = await _eutils_request(session, limiter, "POST", f"{EUTILS_BASE}/efetch.fcgi", data=data)
+        except Exception as e:
+            if failed_chunks is None:
+                raise
+            # caller asked to continue past failed chunks; record the IDs so the gap can be reported
+            print("efetch chunk failed:", type(e).__name__, e)
+            failed_chunks.append(ids)
+            return []
+    return await asyncio.get_running_loop().run_in_executor(_PARSE_POOL, _parse_efetch_xml, body)
+
+async def iter_pubmed_articles(query: str, retmax: int = 50, email: Optional[str] = None, api_key: Optional[str] = None, failed_chunks: Optional[List[List[str]]] = None) -> AsyncIterator[List[PubMedArticle]]:
+    """
+    Search PubMed and yield parsed articles one efetch chunk at a time, in the order chunks arrive.
+    IDs are fetched in EFETCH_CHUNK_SIZE batches, concurrently within NCBI's request limits.
+    An efetch chunk that still fails after retries raises, unless failed_chunks is given: then its IDs
+    are appended there and the remaining chunks are still yielded.
+    """
+    params = {"tool": "pubmed-semantic", "email": (email or "").strip() or "pubmed-semantic@example.com"}
     if api_key:
-        Entrez.api_key = api_key
+        params["api_key"] = api_key
 
-    handle = Entrez.esearch(db="pubmed", term=query, retmax= retmax)
-    record = Entrez.read(handle)
-    handle.close()
-    id_list = record.get("IdList", [])
+    session = _get_session()
+    limiter = _get_limiter(api_key)
+    search_params = {**params, "db": "pubmed", "term": query, "retmax": str(retmax), "retmode": "json"}
+    body = await _eutils_request(session, limiter, "GET", f"{EUTILS_BASE}/esearch.fcgi", params=search_params)
+    record = json.loads(body)
+    id_list = record.get("esearchresult", {}).get("idlist", [])
     if not id_list:
-        return []
+        return
 
-    handle = Entrez.efetch(db="pubmed", id=",".join(id_list), rettype="abstract", retmode="xml")
-    fetch_record = Entrez.read(handle)
-    handle.close()
+    # the limiter paces request starts; the semaphore caps how many are in flight
+    sem = asyncio.Semaphore(10 if api_key else 3)
+    chunks = [id_list[i : i + EFETCH_CHUNK_SIZE] for i in range(0, len(id_list), EFETCH_CHUNK_SIZE)]
+    tasks = [asyncio.create_task(_efetch_chunk(session, limiter, sem, ids, params, failed_chunks)) for ids in chunks]
+    try:
+        for next_chunk in asyncio.as_completed(tasks):
+            yield await next_chunk
+    finally:
+        for task in tasks:
+            task.cancel()
 
+async def fetch_pubmed_articles(query: str, retmax: int = 50, email: Optional[str] = None, api_key: Optional[str] = None) -> List[PubMedArticle]:
+    """
+    Search and fetch PubMed articles; returns PubMedArticle objects.
+    """
     articles = []
-    for entry in fetch_record.get("PubmedArticle", []):
-        parsed = _parse_article(entry)
-        if parsed:
-            articles.append(parsed)
+    async for chunk in iter_pubmed_articles(query, retmax=retmax, email=email, api_key=api_key):
+        articles.extend(chunk)
     return articles
@@ -1,12 +1,21 @@
 # backend/search_logic.py
+import asyncio
 import re
-from typing import List, Dict, Optional
-from pubmed_fetcher import fetch_pubmed_articles, PubMedArticle
-from embedder import TextEmbedder
-from vector_store import build_faiss_index, search_index
+from contextlib import aclosing
+from typing import AsyncIterator, List, Dict, Optional, Tuple
+from pubmed_fetcher import iter_pubmed_articles, PubMedArticle
+from embedder import TextEmbedder, get_embedder
+from embedding_cache import get_embedding_cache
+from vector_store import build_faiss_index, search_index, flat_topk
 import numpy as np
+import torch
 import os
-from gemini_integration import call_gemini_summarize
+from gemini_integration import summarize_articles
+
+_TERM_RE = re.compile(r"[A-Za-z0-9\-\']+")
+
+# below this many documents a plain matmul beats building a FAISS index
+FLAT_SEARCH_MAX_DOCS = 10_000
 
 # small synonym & MeSH maps (extend as needed)
 GENERAL_SYNS = {
@@ -25,24 +34,24 @@ MESH_MAP = {
     "stroke": ["Stroke"]
 }
 
+# precomputed at import: one lookup per token, one regex scan for MeSH keys (longest first)
+_ALL_SYNS: Dict[str, Tuple[str, ...]] = {
+    k: tuple(GENERAL_SYNS.get(k, []) + MEDICAL_SYNS.get(k, []) + MESH_MAP.get(k, []))
+    for k in GENERAL_SYNS.keys() | MEDICAL_SYNS.keys() | MESH_MAP.keys()
+}
+_MESH_RE = re.compile("|".join(map(re.escape, sorted(MESH_MAP, key=len, reverse=True))))
+
 def tokenize_terms(query: str) -> List[str]:
-    return re.findall(r"[A-Za-z0-9\-\']+", query)
+    return _TERM_RE.findall(query)
 
 def expand_term_with_synonyms(term: str) -> List[str]:
-    term_l = term.lower()
-    syns = []
-    syns.extend(GENERAL_SYNS.get(term_l, []))
-    syns.extend(MEDICAL_SYNS.get(term_l, []))
-    if term_l in MESH_MAP:
-        syns.extend(MESH_MAP[term_l])
-    return [term] + syns
+    return [term, *_ALL_SYNS.get(term.lower(), ())]
 
 def mesh_terms_for_query(tokens: List[str]) -> List[str]:
-    mesh_terms = []
     joined = " ".join(tokens).lower()
-    for k, v in MESH_MAP.items():
-        if k in joined:
-            mesh_terms.extend(v)
+    mesh_terms = []
+    for k in dict.fromkeys(_MESH_RE.findall(joined)):
+        mesh_terms.extend(MESH_MAP[k])
     return mesh_terms
 
 def build_boolean_query(query: str, use_mesh: bool = True) -> str:
@@ -67,7 +76,59 @@ def build_boolean_query(query: str, use_mesh: bool = True) -> str:
             groups.append(mesh_group)
     return " AND ".join(groups) if groups else query
 
-def run_search_pipeline(
+def _encode_documents(embedder: TextEmbedder, model_name: str, pmids: List[str], texts: List[str]) -> torch.Tensor:
+    """
+    Encode abstracts, reusing cached embeddings by PMID and only running the model on new ones.
+    The result stays on the embedder's device.
+    """
+    try:
+        cached_pmids, cached_vectors = get_embedding_cache().get_many(model_name, pmids)
+    except Exception as e:
+        print("Embedding cache read failed:", e)
+        cached_pmids, cached_vectors = [], None
+    cached = {pmid: row for row, pmid in enumerate(cached_pmids)}
+
+    doc_embeddings = torch.empty((len(texts), embedder.hidden_size), device=embedder.device, dtype=embedder.dtype)
+    hits = [i for i, pmid in enumerate(pmids) if pmid in cached]
+    missing = [i for i, pmid in enumerate(pmids) if pmid not in cached]
+    if hits:
+        # one host-to-device copy for all cached rows
+        cached_rows = torch.from_numpy(cached_vectors[[cached[pmids[i]] for i in hits]])
+        doc_embeddings[hits] = cached_rows.to(device=embedder.device, dtype=embedder.dtype)
+    if missing:
+        if hits:
+            new_embeddings = embedder.encode_tensor([texts[i] for i in missing], batch_size=8, normalize=True)
+            doc_embeddings[missing] = new_embeddings
+        else:
+            new_embeddings = embedder.encode_tensor(texts, batch_size=8, normalize=True, out=doc_embeddings)
+        try:
+            get_embedding_cache().put_many(model_name, [pmids[i] for i in missing], new_embeddings.float().cpu().numpy())
+        except Exception as e:
+            print("Embedding cache write failed:", e)
+    return doc_embeddings
+
+async def _encode_stream(embedder_task: "asyncio.Future[TextEmbedder]", model_name: str, queue: "asyncio.Queue") -> List[torch.Tensor]:
+    """
+    Consumer side of the fetch/encode overlap: encode (pmids, texts) chunks as they are queued until None arrives.
+    """
+    embedder = await embedder_task
+    parts = []
+    while True:
+        item = await queue.get()
+        if item is None:
+            return parts
+        pmids, texts = item
+        # Model work is blocking; keep it off the event loop.
+        parts.append(await asyncio.to_thread(_encode_documents, embedder, model_name, pmids, texts))
+
+def _rank(embedder: TextEmbedder, doc_embeddings: torch.Tensor, query: str, top_k: int):
+    q_emb = embedder.encode_tensor([query], batch_size=1, normalize=True)
+    if doc_embeddings.shape[0] < FLAT_SEARCH_MAX_DOCS:
+        return flat_topk(doc_embeddings, q_emb, top_k=top_k)
+    index = build_faiss_index(doc_embeddings.float().cpu().numpy())
+    return search_index(index, q_emb.float().cpu().numpy(), top_k=top_k)
+
+async def iter_search_events(
     query: str,
     retmax: int = 200,
     top_k: int = 10,
@@ -77,22 +138,64 @@ def run_search_pipeline(
     use_mesh: bool = True,
     use_gemini_summary: bool = False,
     gemini_api_key: Optional[str] = None
-) -> Dict:
+) -> AsyncIterator[Dict]:
+    """
+    Run the search and yield events as soon as each part is ready:
+    {"type": "meta", ...counts}, then {"type": "result", "result": {...}} per ranked article,
+    then {"type": "summary", "index": i, "summary": str} for the top-5.
+    efetch chunks that fail after retries are skipped; meta then carries partial=True and their count.
+    """
     boolean_query = build_boolean_query(query, use_mesh=use_mesh)
-    articles = fetch_pubmed_articles(boolean_query, retmax=retmax, email=ncbi_email, api_key=ncbi_api_key)
-    if not articles:
-        return {"original_query": query, "boolean_query": boolean_query, "total_fetched": 0, "results": []}
 
-    texts = [a.abstract for a in articles if isinstance(a.abstract, str) and a.abstract.strip()]
-    keep_indices = [i for i, a in enumerate(articles) if isinstance(a.abstract, str) and a.abstract.strip()]
+    # Load the model and encode each efetch chunk while later chunks are still downloading.
+    embedder_task = asyncio.ensure_future(asyncio.to_thread(get_embedder, model_name=model_name))
+    queue: asyncio.Queue = asyncio.Queue()
+    encode_task = asyncio.create_task(_encode_stream(embedder_task, model_name, queue))
+    articles: List[PubMedArticle] = []
+    texts: List[str] = []
+    keep_indices: List[int] = []
+    failed_chunks: List[List[str]] = []
+    try:
+        async with aclosing(iter_pubmed_articles(boolean_query, retmax=retmax, email=ncbi_email, api_key=ncbi_api_key, failed_chunks=failed_chunks)) as chunks:
+            async for chunk in chunks:
+                if encode_task.done():
+                    # encoder stopped early (it failed); stop downloading and surface its error below
+                    break
+                pmids, chunk_texts = [], []
+                for a in chunk:
+                    if isinstance(a.abstract, str) and a.abstract.strip():
+                        keep_indices.append(len(articles))
+                        pmids.append(a.pmid)
+                        chunk_texts.append(a.abstract)
+                    articles.append(a)
+                if chunk_texts:
+                    texts.extend(chunk_texts)
+                    queue.put_nowait((pmids, chunk_texts))
+    except BaseException:
+        # fetching failed or was cancelled: stop the encoder and retrieve both tasks' outcomes
+        encode_task.cancel()
+        embedder_task.cancel()
+        await asyncio.gather(encode_task, embedder_task, return_exceptions=True)
+        raise
+    finally:
+        queue.put_nowait(None)
+    parts = await encode_task
+
+    meta = {
+        "type": "meta", "original_query": query, "boolean_query": boolean_query, "total_fetched": len(articles),
+        "partial": bool(failed_chunks), "failed_chunks": len(failed_chunks), "failed_pmids": sum(len(ids) for ids in failed_chunks),
+    }
+    if not articles:
+        yield meta
+        return
     if not texts:
-        return {"original_query": query, "boolean_query": boolean_query, "total_fetched": len(articles), "total_with_abstracts": 0, "results": []}
+        yield {**meta, "total_with_abstracts": 0}
+        return
+    yield {**meta, "total_with_abstracts": len(texts)}
 
-    embedder = TextEmbedder(model_name=model_name)
-    doc_embeddings = embedder.encode(texts, batch_size=8, normalize=True)
-    index = build_faiss_index(doc_embeddings)
-    q_emb = embedder.encode([query], batch_size=1, normalize=True)
-    scores, inds = search_index(index, q_emb, top_k=top_k)
+    embedder = await embedder_task
+    doc_embeddings = torch.cat(parts) if len(parts) > 1 else parts[0]
+    scores, inds = await asyncio.to_thread(_rank, embedder, doc_embeddings, query, top_k)
 
     results = []
     for score, local_idx in zip(scores[0], inds[0]):
@@ -100,7 +203,7 @@ def run_search_pipeline(
             continue
         global_idx = keep_indices[local_idx]
         art = articles[global_idx]
-        results.append({
+        result = {
             "pmid": art.pmid,
             "title": art.title,
             "abstract": art.abstract,
@@ -109,27 +212,47 @@ def run_search_pipeline(
             "year": art.year,
             "authors": art.authors,
             "score": float(score)
-        })
+        }
+        results.append(result)
+        yield {"type": "result", "result": result}
 
     # Top-5 summaries
-    summaries = []
     if use_gemini_summary:
         api_key = gemini_api_key or os.getenv("GEMINI_API_KEY")
     else:
         api_key = None
 
-    for r in results[:5]:
-        try:
-            s = call_gemini_summarize(api_key, r["title"], r["abstract"])
-        except Exception as e:
-            print("Summarization failed:", e)
-            s = (r["abstract"] or "")[:400] + "..."
-        r["summary"] = s
-
-    return {
-        "original_query": query,
-        "boolean_query": boolean_query,
-        "total_fetched": len(articles),
-        "total_with_abstracts": len(texts),
-        "results": results
-    }
+    top = results[:5]
+    try:
+        summaries = await summarize_articles(api_key, [(r["title"], r["abstract"]) for r in top])
+    except Exception as e:
+        print("Summarization failed:", e)
+        summaries = [(r["abstract"] or "")[:400] + "..." for r in top]
+    for i, s in enumerate(summaries):
+        yield {"type": "summary", "index": i, "summary": s}
+
+async def run_search_pipeline(
+    query: str,
+    retmax: int = 200,
+    top_k: int = 10,
+    model_name: str = "microsoft/BiomedNLP-PubMedBERT-base-uncased-abstract",
+    ncbi_email: Optional[str] = None,
+    ncbi_api_key: Optional[str] = None,
+    use_mesh: bool = True,
+    use_gemini_summary: bool = False,
+    gemini_api_key: Optional[str] = None
+) -> Dict:
+    out: Dict = {}
+    results: List[Dict] = []
+    async for event in iter_search_events(
+        query, retmax=retmax, top_k=top_k, model_name=model_name, ncbi_email=ncbi_email, ncbi_api_key=ncbi_api_key,
+        use_mesh=use_mesh, use_gemini_summary=use_gemini_summary, gemini_api_key=gemini_api_key
+    ):
+        if event["type"] == "meta":
+            out.update({k: v for k, v in event.items() if k != "type"})
+        elif event["type"] == "result":
+            results.append(event["result"])
+        elif event["type"] == "summary":
+            results[event["index"]]["summary"] = event["summary"]
+    out["results"] = results
+    return out
@@ -1,16 +1,89 @@
 # backend/vector_store.py
+import threading
+from typing import Dict, Tuple
 import numpy as np
 import faiss
+import torch
+
+# Above this many vectors the FAISS index stores 8-bit scalar-quantized codes instead of float32.
+SQ8_MIN_DOCS = 1024
+
+# Largest corpus searched through a captured CUDA graph; bigger ones run eagerly.
+CUDA_GRAPH_MAX_DOCS = 4096
+# Graphs are captured once per bucket at this k and sliced per request (matches the UI's top_k limit).
+CUDA_GRAPH_MAX_K = 100
+# Smallest bucket: must hold at least CUDA_GRAPH_MAX_K rows for topk.
+CUDA_GRAPH_MIN_BUCKET = 1 << (CUDA_GRAPH_MAX_K - 1).bit_length()
+
+class _TopKGraph:
+    """
+    CUDA graph for (1, D) query vs (bucket, D) docs -> top-CUDA_GRAPH_MAX_K, replayed with static buffers.
+    Rows past the live corpus size are masked to -inf so they never rank.
+    """
+    def __init__(self, bucket: int, dim: int, dtype: torch.dtype, device: torch.device):
+        self.docs = torch.zeros((bucket, dim), dtype=dtype, device=device)
+        self.query = torch.zeros((1, dim), dtype=dtype, device=device)
+        self.mask = torch.zeros((bucket,), dtype=dtype, device=device)
+        self.k = CUDA_GRAPH_MAX_K
+        self.lock = threading.Lock()
+
+        # warm up on a side stream before capture, as torch.cuda.graph requires
+        stream = torch.cuda.Stream(device=device)
+        stream.wait_stream(torch.cuda.current_stream(device))
+        with torch.cuda.stream(stream):
+            for _ in range(2):
+                self._run()
+        torch.cuda.current_stream(device).wait_stream(stream)
+
+        # capture lazily from a worker thread while other threads may be encoding on the same device;
+        # thread_local keeps their CUDA calls from invalidating (or being rejected by) this capture
+        self.graph = torch.cuda.CUDAGraph()
+        with torch.cuda.graph(self.graph, capture_error_mode="thread_local"):
+            self.scores, self.indices = self._run()
+
+    def _run(self):
+        return torch.topk(torch.matmul(self.query, self.docs.T) + self.mask, self.k, dim=1)
+
+    def search(self, doc_embeddings: torch.Tensor, query_embeddings: torch.Tensor, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        n = doc_embeddings.shape[0]
+        with self.lock:
+            self.docs[:n].copy_(doc_embeddings)
+            self.query.copy_(query_embeddings)
+            self.mask[:n] = 0
+            self.mask[n:] = float("-inf")
+            self.graph.replay()
+            # k <= n, so the first k entries are live rows; padding sorts last at -inf
+            return self.scores[:, :k].float().cpu().numpy(), self.indices[:, :k].cpu().numpy()
+
+_topk_graphs: Dict[tuple, _TopKGraph] = {}
+_topk_graphs_lock = threading.Lock()
+
+def _graph_topk(doc_embeddings: torch.Tensor, query_embeddings: torch.Tensor, k: int):
+    # bucket the corpus size to the next power of two: at most 6 graphs (128..4096) per device/dtype
+    bucket = max(CUDA_GRAPH_MIN_BUCKET, 1 << (doc_embeddings.shape[0] - 1).bit_length())
+    key = (bucket, doc_embeddings.shape[1], doc_embeddings.dtype, doc_embeddings.device)
+    with _topk_graphs_lock:
+        graph = _topk_graphs.get(key)
+        if graph is None:
+            graph = _TopKGraph(bucket, doc_embeddings.shape[1], doc_embeddings.dtype, doc_embeddings.device)
+            _topk_graphs[key] = graph
+    return graph.search(doc_embeddings, query_embeddings.to(doc_embeddings.dtype), k)
 
 def build_faiss_index(embeddings: np.ndarray):
     """
     Build IndexFlatIP using inner-product on normalized vectors.
     Input: embeddings (N, D) float32 and already L2-normalized.
+    Large inputs get an 8-bit IndexScalarQuantizer trained on the batch itself (4x less memory traffic);
+    queries stay float32.
     """
     if embeddings.dtype != np.float32:
         embeddings = embeddings.astype(np.float32)
     dim = embeddings.shape[1]
-    index = faiss.IndexFlatIP(dim)
+    if embeddings.shape[0] > SQ8_MIN_DOCS:
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+        index.train(embeddings)
+    else:
+        index = faiss.IndexFlatIP(dim)
     index.add(embeddings)
     return index
 
@@ -19,3 +92,29 @@ def search_index(index, query_embeddings: np.ndarray, top_k: int = 10):
         query_embeddings = query_embeddings.astype(np.float32)
     scores, indices = index.search(query_embeddings, top_k)
     return scores, indices
+
+def flat_topk(doc_embeddings: np.ndarray, query_embeddings: np.ndarray, top_k: int = 10):
+    """
+    Exact inner-product top-k via a single matmul; cheaper than building a FAISS index for small N.
+    Accepts NumPy arrays or torch tensors (searched on their own device). Returns (scores, indices) shaped like search_index.
+    """
+    if isinstance(doc_embeddings, torch.Tensor):
+        k = min(top_k, doc_embeddings.shape[0])
+        if doc_embeddings.is_cuda and query_embeddings.shape[0] == 1 and 0 < k <= CUDA_GRAPH_MAX_K \
+                and doc_embeddings.shape[0] <= CUDA_GRAPH_MAX_DOCS:
+            return _graph_topk(doc_embeddings, query_embeddings, k)
+        scores, indices = torch.topk(torch.matmul(query_embeddings, doc_embeddings.T), k, dim=1)
+        return scores.float().cpu().numpy(), indices.cpu().numpy()
+    scores = np.matmul(query_embeddings, doc_embeddings.T)
+    k = min(top_k, scores.shape[1])
+    if k <= 0:
+        empty = np.zeros((scores.shape[0], 0))
+        return empty.astype(np.float32), empty.astype(np.int64)
+    if k < scores.shape[1]:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        part = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1)
+    indices = np.take_along_axis(part, order, axis=1)
+    return np.take_along_axis(part_scores, order, axis=1), indices
@@ -1,4 +1,5 @@
 import os
+import json
 import hashlib
 from typing import List, Dict, Optional
 
@@ -62,33 +63,50 @@ if do_search and query.strip():
         "use_gemini_summary": use_gemini_summary,
         "gemini_api_key": gemini_key or None
     }
+    # Stream results from the backend and render each card as soon as it arrives
+    results: List[Dict] = []
+    total = 0
+    status = st.empty()
     with st.spinner("Calling backend search..."):
         try:
-            resp = requests.post(f"{backend_url.rstrip('/')}/search", json=payload, timeout=500)
-            resp.raise_for_status()
-            data = resp.json()
+            with requests.post(f"{backend_url.rstrip('/')}/search/stream", json=payload, timeout=500, stream=True) as resp:
+                resp.raise_for_status()
+                for line in resp.iter_lines():
+                    if not line:
+                        continue
+                    event = json.loads(line)
+                    kind = event.get("type")
+                    if kind == "error":
+                        raise RuntimeError(event.get("detail"))
+                    if kind == "meta":
+                        total = event.get("total_fetched", 0)
+                        status.write(f"Fetched {total} articles from PubMed — ranking...")
+                        if event.get("partial"):
+                            st.warning(f"{event.get('failed_chunks')} PubMed fetch batch(es) failed; {event.get('failed_pmids')} articles are missing from these results.")
+                    elif kind == "result":
+                        r = event["result"]
+                        results.append(r)
+                        i = len(results)
+                        status.write(f"Fetched {total} articles from PubMed — displaying top {i} results.")
+                        st.markdown(f"### {i}. [{r.get('title')}]({r.get('url')})")
+                        meta = []
+                        if r.get("journal"):
+                            meta.append(r.get("journal"))
+                        if r.get("year"):
+                            meta.append(str(r.get("year")))
+                        if r.get("authors"):
+                            meta.append("Authors: " + ", ".join(r.get("authors")[:3]) + (", et al." if len(r.get("authors")) > 3 else ""))
+                        st.write(" • ".join(meta))
+                        st.write(r.get("abstract")[:800] + ("…" if len(r.get("abstract")) > 800 else ""))
+                        st.write(f"Similarity: **{r.get('score'):.4f}**")
+                        st.markdown("---")
+                    elif kind == "summary":
+                        results[event["index"]]["summary"] = event.get("summary")
         except Exception as e:
             st.error(f"Search failed: {e}")
             st.stop()
 
-    results = data.get("results", [])
-    total = data.get("total_fetched", 0)
-    st.write(f"Fetched {total} articles from PubMed — displaying top {len(results)} results.")
-
-    # Show results cards
-    for i, r in enumerate(results, start=1):
-        st.markdown(f"### {i}. [{r.get('title')}]({r.get('url')})")
-        meta = []
-        if r.get("journal"):
-            meta.append(r.get("journal"))
-        if r.get("year"):
-            meta.append(str(r.get("year")))
-        if r.get("authors"):
-            meta.append("Authors: " + ", ".join(r.get("authors")[:3]) + (", et al." if len(r.get("authors")) > 3 else ""))
-        st.write(" • ".join(meta))
-        st.write(r.get("abstract")[:800] + ("…" if len(r.get("abstract")) > 800 else ""))
-        st.write(f"Similarity: **{r.get('score'):.4f}**")
-        st.markdown("---")
+    status.write(f"Fetched {total} articles from PubMed — displaying top {len(results)} results.")
 
     # Visualize top-5 summaries (if present)
     if results: